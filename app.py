@@ -3,6 +3,13 @@ import pandas as pd
 import plotly.express as px
 import google.generativeai as genai
 import numpy as np
+import os
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # ==========================================
 # 1. 設定與常數
@@ -14,13 +21,35 @@ GEMINI_MODELS = [
     "models/gemini-2.5-pro",
 ]
 
+# AI 回覆快取：最多保留幾筆、每筆保留幾秒 (過期後重新產生)
+GEMINI_CACHE_SIZE = 64
+GEMINI_CACHE_TTL = 3600
+
 # 指定分析的重點國家清單
-TARGET_COUNTRIES = [
+TARGET_COUNTRIES = frozenset([
     "Taiwan", "Hong Kong", "Japan", "South Korea", "Thailand", 
     "Vietnam", "Philippines", "Singapore", "China", 
     "United States", "Canada", "United Kingdom", "France", 
     "Sweden", "Norway"
-]
+])
+
+DATA_FILE = '總表(new)_20251027.zip'
+
+# 分析會用到的欄位 (另加所有 Views 欄位)
+LOAD_COLUMNS = ['week', 'category', 'country_name', 'Country', 'show_title', 'weekly_rank']
+
+# 讀檔時直接指定型別：高重複字串欄位用 category (groupby / 篩選改走整數代碼)，名次只有 1-10 用 int8
+LOAD_DTYPES = {
+    'country_name': 'category',
+    'Country': 'category',
+    'category': 'category',
+    'show_title': 'category',
+    'weekly_rank': 'int8',
+}
+
+# Parquet 快取檔名帶有讀檔設定的指紋：改了 LOAD_COLUMNS / LOAD_DTYPES 會自動改用新檔；
+# 改了 read_source 的清理邏輯時，把這個版本號加一
+PARQUET_CACHE_VERSION = 3
 
 st.set_page_config(page_title="Netflix 數據戰情室 V6.3", layout="wide")
 st.title("🎬 Netflix 深度數據分析系統 (最終優化版)")
@@ -28,28 +57,135 @@ st.title("🎬 Netflix 深度數據分析系統 (最終優化版)")
 # ==========================================
 # 2. 資料讀取
 # ==========================================
+def read_source(file_path):
+    header = pd.read_csv(file_path, nrows=0).columns
+    use_cols = [c for c in header if c in LOAD_COLUMNS or 'Views' in c]
+    # dtype 在讀完後才套用：pandas 3 的 pyarrow 引擎只要帶 dtype，就會把含缺值的 Views 欄轉整數而失敗
+    df = pd.read_csv(file_path, engine='pyarrow', usecols=use_cols, parse_dates=['week']).astype(LOAD_DTYPES)
+
+    # 冠軍旗標預先算好供各處篩選
+    df['is_rank1'] = df['weekly_rank'] == 1
+    
+    # 確保 Views 相關欄位是數字 (處理逗號)
+    view_cols = [c for c in df.columns if 'Views' in c]
+    for col in view_cols:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        cleaned = df[col].astype(str).str.replace(',', '', regex=False)
+        df[col] = pd.to_numeric(cleaned, errors='coerce', downcast='integer')
+
+    # 觀看數都是 10 萬的倍數，float32 可精確表示，記憶體減半；無法無損轉換的欄位維持原型別
+    for col in view_cols:
+        narrowed = df[col].astype('float32')
+        if narrowed.astype('float64').equals(df[col].astype('float64')):
+            df[col] = narrowed
+    
+    return df
+
+def parquet_cache_path(file_path):
+    schema = repr((PARQUET_CACHE_VERSION, LOAD_COLUMNS, sorted(LOAD_DTYPES.items())))
+    tag = hashlib.sha256(schema.encode()).hexdigest()[:8]
+    return f"{os.path.splitext(file_path)[0]}.{tag}.parquet"
+
+def write_parquet_cache(df, parquet_path):
+    # 先寫到同目錄的暫存檔再 os.replace 換上：多個 session 同時寫入或中途失敗，都不會留下寫一半的快取
+    # 暫存檔名各 session 唯一，以 'xb' 建立 (不覆寫既有檔案)，權限照一般 umask，不必動到全域的 umask
+    tmp_path = f"{parquet_path}.{uuid.uuid4().hex}.tmp.parquet"
+    try:
+        with open(tmp_path, 'xb') as f:
+            df.to_parquet(f, compression='zstd')
+        os.replace(tmp_path, parquet_path)
+    except (OSError, ValueError, TypeError):
+        # 寫不進去 (目錄唯讀、pyarrow 無法轉換欄位等) 就略過快取，下次冷啟動再讀 CSV
+        pass
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 @st.cache_data
-def load_data(file_path):
+def load_data(file_path, category):
     try:
-        df = pd.read_csv(file_path)
-        df['week'] = pd.to_datetime(df['week'])
-        df['Week_Str'] = df['week'].dt.strftime('%Y-%m-%d')
-        
-        # 確保 Views 相關欄位是數字 (處理逗號)
-        view_cols = [c for c in df.columns if 'Views' in c]
-        for col in view_cols:
-            if df[col].dtype == 'object':
-                df[col] = df[col].astype(str).str.replace(',', '').apply(pd.to_numeric, errors='coerce')
-        
-        return df
+        # 第一次解析 CSV 後另存 Parquet (連同 category 等 dtype)，之後冷啟動直接讀 Parquet
+        parquet_path = parquet_cache_path(file_path)
+        df = None
+        if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(file_path):
+            try:
+                df = pd.read_parquet(parquet_path)
+            except (OSError, ValueError):
+                # 快取檔損毀 (例如寫到一半) 時改讀 CSV，並重寫快取
+                df = None
+        if df is None:
+            df = read_source(file_path)
+            write_parquet_cache(df, parquet_path)
+
+        # 每個類別各快取一份，切換類別不必再篩選複製；
+        # 同時去掉此類別沒出現的 category 值，讓 cat.categories 正好是實際出現的值
+        sliced = df[df['category'] == category]
+        return sliced.assign(**{c: sliced[c].cat.remove_unused_categories() for c, t in LOAD_DTYPES.items() if t == 'category'})
     except FileNotFoundError:
         st.error(f"找不到檔案 '{file_path}'")
         return pd.DataFrame()
 
-df_raw = load_data('總表(new)_20251027.zip')
-
-if df_raw.empty:
-    st.stop()
+# 依類別預先彙總常用的 groupby 結果，切換國家時只需切片
+# 各表只讀，以 cache_resource 共用同一份物件，不必每次反序列化
+@st.cache_resource
+def precompute(_df, category):
+    builders = {
+        # (觀看國, 製片國) 一次 groupby 同時算出片量、上榜週數、冠軍週數
+        'pair_stats': lambda: _df.groupby(['country_name', 'Country'], observed=True).agg(
+            Unique_Titles=('show_title', 'nunique'),
+            Total_Weeks=('show_title', 'size'),
+            Weeks_at_No1=('is_rank1', 'sum'),
+        ),
+        # 每組 (觀看國, 製片國) 的作品清單，兩個視角的詳細清單分頁都直接切片
+        'pair_titles': lambda: titles_per(_df, ['country_name', 'Country']).set_index(['country_name', 'Country'])['Titles_List'],
+        'pair_champions': lambda: titles_per(_df[_df['is_rank1']], ['country_name', 'Country'], 'Champion_Titles').set_index(['country_name', 'Country'])['Champion_Titles'],
+        'traveling': lambda: _df.groupby(['Country', 'show_title'], observed=True)['country_name'].nunique(),
+        'title_views': lambda: title_final_views(_df),
+        'weeks_on_chart': lambda: _df.groupby(['Country', 'show_title', 'country_name'], observed=True).size(),
+        # 依國家排序的索引：取單一國家的資料列改為二分搜尋切片，不必整欄比對
+        # (is_rank1 只是內部旗標，不放進「原始數據」分頁顯示的資料列)
+        'rows_by_viewer': lambda: _df.drop(columns='is_rank1').set_index('country_name', drop=False).sort_index(kind='stable'),
+        'rows_by_producer': lambda: _df.drop(columns='is_rank1').set_index('Country', drop=False).sort_index(kind='stable'),
+    }
+    # 各組彙總互不相依且只做 pandas 運算 (不呼叫 st)，可平行執行
+    with ThreadPoolExecutor(max_workers=len(builders)) as executor:
+        futures = {name: executor.submit(build) for name, build in builders.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+def nonzero_ranking(series, key_col, value_col):
+    series = series[series > 0]
+    return series.rename_axis(key_col).reset_index(name=value_col).sort_values(value_col, ascending=False)
+
+# 各分組的不重複作品清單 (以逗號串接)
+def titles_per(df, key, name='Titles_List'):
+    key = key if isinstance(key, list) else [key]
+    return df[key + ['show_title']].drop_duplicates().groupby(key, observed=True)['show_title'].agg(', '.join).reset_index(name=name)
+
+# 每部作品的最新觀看數 (只與類別有關，與國家無關)
+def title_final_views(df):
+    all_view_cols = [c for c in df.columns if 'Views' in c]
+    all_view_cols.sort(reverse=True)
+    
+    unique_titles_view = df[['show_title'] + all_view_cols].drop_duplicates(subset=['show_title'])
+    
+    # 取最新一期 > 0 的觀看數：非正值視為缺值，向左回填後第一欄即為答案
+    views = unique_titles_view[all_view_cols]
+    final_views = views.where(views > 0).bfill(axis=1).iloc[:, 0].fillna(0) if all_view_cols else 0
+    return unique_titles_view[['show_title']].assign(Final_Views=final_views).set_index('show_title')['Final_Views']
+
+# 每個類別只算一次：實際出現的觀看國 / 製片國集合，以及可選國家 (兩者聯集 ∩ 目標國家)
+# 只回傳這幾個小集合，主程式每次 rerun 不必反序列化整份類別資料；讀檔失敗時回傳 None
+@st.cache_data
+def country_options(category):
+    df = load_data(DATA_FILE, category)
+    # 讀檔失敗時 load_data 回傳沒有欄位的空表；類別本身沒有資料則照常回傳空集合
+    if df.columns.empty:
+        return None
+    # 類別欄已去掉未出現的值，categories 即為實際出現的國家
+    viewers, producers = df['country_name'].cat.categories, df['Country'].cat.categories
+    available = np.union1d(viewers.to_numpy(), producers.to_numpy())
+    return set(viewers), set(producers), [c for c in available if c in TARGET_COUNTRIES]
 
 # ==========================================
 # 3. 側邊欄設定
@@ -57,7 +193,11 @@ if df_raw.empty:
 st.sidebar.header("⚙️ 參數設定")
 
 category_mode = st.sidebar.radio("內容類別", ("Films", "TV"), index=0)
-df_main = df_raw[df_raw['category'] == category_mode].copy()
+countries = country_options(category_mode)
+
+if countries is None:
+    st.stop()
+viewer_countries, producer_countries, final_country_list = countries
 
 gemini_api_key = st.sidebar.text_input("Gemini API Key", type="password")
 selected_model = st.sidebar.selectbox("AI 模型", GEMINI_MODELS)
@@ -67,23 +207,183 @@ st.sidebar.markdown("---")
 # ==========================================
 # 4. Gemini Helper
 # ==========================================
+# genai.configure 是全域設定，只在 API Key 變更時重設
+@st.cache_resource(max_entries=1)
+def configure_gemini(api_key):
+    genai.configure(api_key=api_key)
+    return True
+
+# 已完成的回覆依 (API Key 雜湊, 模型, prompt) 保存，同一把 Key 重複提問直接回傳；
+# 換了 Key (或 Key 已失效) 不會拿到別人付費產生的回答。依最近使用淘汰，並在 TTL 後重新產生
+@st.cache_resource
+def gemini_answers():
+    return OrderedDict(), threading.Lock()
+
 def ask_gemini(api_key, prompt, model_name):
     if not api_key:
-        return "⚠️ 請輸入 API Key"
+        yield "⚠️ 請輸入 API Key"
+        return
+    answers, lock = gemini_answers()
+    key = (hashlib.sha256(api_key.encode()).hexdigest(), model_name, prompt)
+    with lock:
+        cached = answers.get(key)
+        if cached is not None and time.monotonic() - cached[0] < GEMINI_CACHE_TTL:
+            answers.move_to_end(key)
+        else:
+            cached = None
+    if cached is not None:
+        yield cached[1]
+        return
     try:
-        genai.configure(api_key=api_key)
+        configure_gemini(api_key)
         model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt)
-        return response.text
+        parts = []
+        for chunk in model.generate_content(prompt, stream=True):
+            parts.append(chunk.text)
+            yield chunk.text
+        with lock:
+            answers[key] = (time.monotonic(), "".join(parts))
+            answers.move_to_end(key)
+            while len(answers) > GEMINI_CACHE_SIZE:
+                answers.popitem(last=False)
     except Exception as e:
-        return f"❌ Error: {str(e)}"
+        yield f"❌ Error: {str(e)}"
 
 # ==========================================
 # 5. 分析核心類別
 # ==========================================
+# 各分頁的彙總表依 (類別, 國家) 快取，重複查看同一國家時直接命中
+@st.cache_data(max_entries=32)
+def viewer_summary(category, country):
+    df = load_data(DATA_FILE, category)
+    tables = precompute(df, category)
+    filtered_df = tables['rows_by_viewer'].loc[country:country].reset_index(drop=True)
+    pair_stats, champions = tables['pair_stats'], tables['pair_champions']
+    by_source = pair_stats.loc[country]
+    by_market = pair_stats[pair_stats.index.get_level_values('Country') == country].droplevel('Country')
+    return {
+        'rows': filtered_df,
+        'unique_counts': nonzero_ranking(by_source['Unique_Titles'], 'Country', 'Unique_Titles'),
+        'rank1_counts': nonzero_ranking(by_source['Weeks_at_No1'], 'Producer_Country', 'Weeks_at_No1'),
+        'rank1_titles': champions[champions.index.get_level_values('country_name') == country].droplevel('country_name').reset_index(),
+        'export_stats': nonzero_ranking(by_market['Unique_Titles'], 'country_name', 'Titles_Count'),
+        'top_titles': tables['weeks_on_chart'].xs(country, level='country_name').nlargest(10).reset_index(name='Weeks_On_Chart'),
+        'detail_list': tables['pair_titles'].loc[country].reset_index(),
+    }
+
+@st.cache_data(max_entries=32)
+def producer_summary(category, country):
+    df = load_data(DATA_FILE, category)
+    tables = precompute(df, category)
+    filtered_df = tables['rows_by_producer'].loc[country:country].reset_index(drop=True)
+    by_market = tables['pair_stats'].xs(country, level='Country')
+    # 海外表現 = 覆蓋表扣掉本國
+    coverage = nonzero_ranking(by_market['Unique_Titles'], 'country_name', 'Unique_Titles')
+    export_stats = coverage[coverage['country_name'] != country].rename(columns={'Unique_Titles': 'Exported_Titles'})
+
+    # 輸出作品矩陣：只看海外市場，且只取矩陣會用到的欄位
+    export_only_df = filtered_df.loc[filtered_df['country_name'] != country, ['show_title', 'country_name', 'week', 'weekly_rank']]
+
+    # 計算指標
+    matrix_stats = export_only_df.groupby('show_title', observed=True, sort=False).agg(
+        Export_Countries=('country_name', 'nunique'),      # Y軸
+        Weeks_Present_Overseas=('week', 'nunique'),        # X軸
+        Best_Rank_Overseas=('weekly_rank', 'min')          # Color
+    )
+    # 觀看數已依作品預先算好，直接依 show_title 索引對齊，不必再 merge
+    matrix_stats['Final_Views'] = tables['title_views'].reindex(matrix_stats.index).fillna(0).to_numpy()
+    matrix_stats = matrix_stats.reset_index()
+    
+    # 計算 Log Views 供氣泡大小使用
+    matrix_stats['Log_Views'] = np.log1p(matrix_stats['Final_Views'].to_numpy()) / np.log(10)
+
+    # 矩陣詳表：排序與千分位格式化跟著摘要一起快取，重新渲染時不必逐列格式化
+    matrix_table = matrix_stats.sort_values('Final_Views', ascending=False)
+    matrix_table = matrix_table.assign(Final_Views_Formatted=matrix_table['Final_Views'].map("{:,.0f}".format))[
+        ['show_title', 'Weeks_Present_Overseas', 'Export_Countries', 'Best_Rank_Overseas', 'Final_Views_Formatted']]
+
+    return {
+        'rows': filtered_df,
+        'matrix_stats': matrix_stats,
+        'matrix_table': matrix_table,
+        'traveling': tables['traveling'].loc[country].nlargest(10).reset_index(name='Country_Count'),
+        'coverage': coverage,
+        'export_stats': export_stats,
+        'raw_weeks': nonzero_ranking(by_market['Total_Weeks'], 'Country', 'Total_Weeks'),
+        'detail_list': tables['pair_titles'].xs(country, level='Country').reset_index(),
+    }
+
+# 世界地圖統一由此建立
+def country_map(df, locations, color, scale, title):
+    return px.choropleth(df, locations=locations, locationmode="country names", color=color, color_continuous_scale=scale, title=title)
+
+# 橫條排名圖：資料已由大到小排好，直接指定 y 軸順序 (由下而上遞增)，瀏覽器端不必再依總和排序
+def ranked_bar(df, x, y, **kwargs):
+    fig = px.bar(df, x=x, y=y, orientation='h', text_auto=True, **kwargs)
+    fig.update_yaxes(categoryorder='array', categoryarray=list(dict.fromkeys(df[y].tolist()))[::-1])
+    return fig
+
+# 圖表物件以 cache_resource 共用 (同一份 figure)，已看過的國家不必重建，地圖受益最大
+@st.cache_resource(max_entries=32)
+def viewer_figures(category, country):
+    summary = viewer_summary(category, country)
+    unique_counts, rank1_counts, export_stats = summary['unique_counts'], summary['rank1_counts'], summary['export_stats']
+    return {
+        'sources': ranked_bar(unique_counts, 'Unique_Titles', 'Country', title=f"{country} 的內容供應國排名 (依片量)", color='Unique_Titles', color_continuous_scale='Viridis'),
+        'champions': None if rank1_counts.empty else px.pie(rank1_counts, values='Weeks_at_No1', names='Producer_Country', title='冠軍週數佔比'),
+        'import_map': country_map(unique_counts, "Country", "Unique_Titles", 'Greens', f"{country} 的內容進口地圖"),
+        'export_map': None if export_stats.empty else country_map(export_stats, "country_name", "Titles_Count", 'Oranges', f"{country} 作品輸出地圖"),
+        'top_titles': ranked_bar(summary['top_titles'], 'Weeks_On_Chart', 'show_title', color='Country'),
+    }
+
+@st.cache_resource(max_entries=32)
+def producer_figures(category, country):
+    summary = producer_summary(category, country)
+    matrix_stats, export_stats = summary['matrix_stats'], summary['export_stats']
+
+    matrix = None
+    if not matrix_stats.empty:
+        matrix = px.scatter(
+            matrix_stats,
+            x='Weeks_Present_Overseas', 
+            y='Export_Countries',       
+            size='Log_Views',           
+            color='Best_Rank_Overseas', 
+            hover_name='show_title',
+            hover_data={'Log_Views': False, 'Final_Views': True}, 
+            
+            range_color=[1, 10], 
+            color_continuous_scale='Reds_r',
+            
+            # --- 視覺修正區 ---
+            size_max=20,   # [修正] 縮小最大尺寸，避免遮擋
+            opacity=0.7,   # [修正] 增加透明度，重疊時可透視
+            # -----------------
+            
+            title=f"{country} 作品輸出強弱分佈",
+            labels={
+                'Weeks_Present_Overseas': '海外上榜週數 (不重複)',
+                'Export_Countries': '輸出國家數',
+                'Final_Views': '總觀看次數',
+                'Best_Rank_Overseas': '最佳名次'
+            }
+        )
+        matrix.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey'))) # 細邊框
+        matrix.update_layout(margin=dict(l=20, r=20, t=50, b=20))
+
+    return {
+        'matrix': matrix,
+        'traveling': ranked_bar(summary['traveling'], 'Country_Count', 'show_title', title=f"輸出國家數最多的 Top 10 作品", color='Country_Count', color_continuous_scale='Oranges'),
+        'coverage_map': country_map(summary['coverage'], "country_name", "Unique_Titles", 'Reds', f"{country} 作品覆蓋熱度圖"),
+        'export_map': None if export_stats.empty else country_map(export_stats, "country_name", "Exported_Titles", 'Purples', "海外輸出地圖"),
+        'market_weeks': ranked_bar(summary['raw_weeks'].head(20), 'Total_Weeks', 'Country', title="上榜總週數 Top 20 市場"),
+    }
+
 class NetflixAnalyzerV6:
-    def __init__(self, df, api_key, model_name):
-        self.df = df.copy()
+    def __init__(self, viewer_countries, producer_countries, api_key, model_name):
+        # 資料中實際出現的觀看國 / 製片國，檢查目標國家時直接查集合，不必掃 unique()
+        self._viewer_countries = viewer_countries
+        self._producer_countries = producer_countries
         self.api_key = api_key
         self.model_name = model_name
 
@@ -93,12 +393,14 @@ class NetflixAnalyzerV6:
     def analyze_viewer(self, target_country):
         st.header(f"🌍 消費市場分析：{target_country} ({category_mode})")
         
-        if target_country not in self.df['country_name'].unique():
+        if target_country not in self._viewer_countries:
             st.warning(f"⚠️ 資料庫中沒有 {target_country} 的觀看數據。")
             return
 
-        filtered_df = self.df[self.df['country_name'] == target_country].copy()
-        domestic_export_df = self.df[self.df['Country'] == target_country].copy()
+        summary = viewer_summary(category_mode, target_country)
+        filtered_df = summary['rows']
+        figures = viewer_figures(category_mode, target_country)
+        unique_counts = summary['unique_counts']
 
         tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
             "📊 來源排名(量)", "🏆 冠軍來源國", "🗺️ 來源地圖", "🚀 本國輸出表現",
@@ -106,42 +408,33 @@ class NetflixAnalyzerV6:
         ])
 
         with tab1:
-            unique_counts = filtered_df.groupby('Country')['show_title'].nunique().reset_index(name='Unique_Titles').sort_values('Unique_Titles', ascending=False)
-            fig = px.bar(unique_counts, x='Unique_Titles', y='Country', orientation='h', text_auto=True, title=f"{target_country} 的內容供應國排名 (依片量)", color='Unique_Titles', color_continuous_scale='Viridis')
-            fig.update_layout(yaxis={'categoryorder':'total ascending'})
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(figures['sources'], use_container_width=True)
             st.dataframe(unique_counts, use_container_width=True)
 
         with tab2:
-            rank1_df = filtered_df[filtered_df['weekly_rank'] == 1]
-            if rank1_df.empty: st.info("無冠軍數據")
+            rank1_counts = summary['rank1_counts']
+            if rank1_counts.empty: st.info("無冠軍數據")
             else:
-                rank1_counts = rank1_df['Country'].value_counts().reset_index()
-                rank1_counts.columns = ['Producer_Country', 'Weeks_at_No1']
                 c1, c2 = st.columns([1, 1])
-                with c1: st.plotly_chart(px.pie(rank1_counts, values='Weeks_at_No1', names='Producer_Country', title='冠軍週數佔比'), use_container_width=True)
+                with c1: st.plotly_chart(figures['champions'], use_container_width=True)
                 with c2: st.dataframe(rank1_counts, use_container_width=True)
-                st.dataframe(rank1_df.groupby('Country')['show_title'].unique().apply(lambda x: ", ".join(x)).reset_index(name='Champion_Titles'), use_container_width=True)
+                st.dataframe(summary['rank1_titles'], use_container_width=True)
 
         with tab3:
-            unique_counts = filtered_df.groupby('Country')['show_title'].nunique().reset_index(name='Unique_Titles') 
-            st.plotly_chart(px.choropleth(unique_counts, locations="Country", locationmode="country names", color="Unique_Titles", color_continuous_scale='Greens', title=f"{target_country} 的內容進口地圖"), use_container_width=True)
+            st.plotly_chart(figures['import_map'], use_container_width=True)
 
         with tab4:
-            if domestic_export_df.empty: st.warning("無自製內容數據")
+            export_stats = summary['export_stats']
+            if export_stats.empty: st.warning("無自製內容數據")
             else:
-                export_stats = domestic_export_df.groupby('country_name')['show_title'].nunique().reset_index(name='Titles_Count').sort_values('Titles_Count', ascending=False)
-                st.plotly_chart(px.choropleth(export_stats, locations="country_name", locationmode="country names", color="Titles_Count", color_continuous_scale='Oranges', title=f"{target_country} 作品輸出地圖"), use_container_width=True)
+                st.plotly_chart(figures['export_map'], use_container_width=True)
                 st.dataframe(export_stats, use_container_width=True)
 
         with tab5:
-            top_titles = filtered_df.groupby(['show_title', 'Country']).size().reset_index(name='Weeks_On_Chart').sort_values('Weeks_On_Chart', ascending=False).head(10)
-            fig = px.bar(top_titles, x='Weeks_On_Chart', y='show_title', orientation='h', color='Country', text_auto=True)
-            fig.update_layout(yaxis={'categoryorder':'total ascending'})
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(figures['top_titles'], use_container_width=True)
 
         with tab6:
-            st.dataframe(filtered_df.groupby('Country')['show_title'].unique().apply(lambda x: ", ".join(x)).reset_index(name='Titles_List'), use_container_width=True)
+            st.dataframe(summary['detail_list'], use_container_width=True)
 
         with tab7:
             st.dataframe(filtered_df, use_container_width=True)
@@ -150,7 +443,7 @@ class NetflixAnalyzerV6:
             if self.api_key and st.button("生成觀看國報告"):
                 top_src = unique_counts.iloc[0]['Country'] if not unique_counts.empty else "無"
                 prompt = f"分析 {target_country} 市場：最大來源{top_src}，請給出3點洞察。"
-                st.markdown(ask_gemini(self.api_key, prompt, self.model_name))
+                st.write_stream(ask_gemini(self.api_key, prompt, self.model_name))
 
     # -------------------------------------------------------------------------
     #  B. 製片國視角
@@ -158,11 +451,13 @@ class NetflixAnalyzerV6:
     def analyze_producer(self, target_country):
         st.header(f"📦 文化輸出分析：{target_country} ({category_mode})")
         
-        if target_country not in self.df['Country'].unique():
+        if target_country not in self._producer_countries:
             st.warning(f"⚠️ 資料庫中沒有 {target_country} 製作的 {category_mode} 數據。")
             return
 
-        filtered_df = self.df[self.df['Country'] == target_country].copy()
+        summary = producer_summary(category_mode, target_country)
+        filtered_df = summary['rows']
+        figures = producer_figures(category_mode, target_country)
 
         tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
             "💎 輸出作品矩陣", 
@@ -184,118 +479,50 @@ class NetflixAnalyzerV6:
             * **顏色**：海外最佳名次 (越紅越好)
             """)
 
-            export_only_df = filtered_df[filtered_df['country_name'] != target_country].copy()
-            
-            if export_only_df.empty:
+            matrix_stats = summary['matrix_stats']
+            if matrix_stats.empty:
                 st.info("該國作品僅在本國上榜，無海外輸出紀錄。")
             else:
-                # 彙整 Views
-                all_view_cols = [c for c in self.df.columns if 'Views' in c]
-                all_view_cols.sort(reverse=True)
-                
-                unique_titles_view = self.df[['show_title'] + all_view_cols].drop_duplicates(subset=['show_title'])
-                
-                def get_latest_views(row):
-                    for col in all_view_cols:
-                        if pd.notna(row[col]) and row[col] > 0:
-                            return row[col]
-                    return 0
-
-                unique_titles_view['Final_Views'] = unique_titles_view.apply(get_latest_views, axis=1)
-                
-                # 計算指標
-                matrix_stats = export_only_df.groupby('show_title').agg(
-                    Export_Countries=('country_name', 'nunique'),      # Y軸
-                    Weeks_Present_Overseas=('week', 'nunique'),        # X軸
-                    Best_Rank_Overseas=('weekly_rank', 'min')          # Color
-                ).reset_index()
-
-                matrix_stats = pd.merge(matrix_stats, unique_titles_view[['show_title', 'Final_Views']], on='show_title', how='left')
-                matrix_stats['Final_Views'] = matrix_stats['Final_Views'].fillna(0)
-                
-                # 計算 Log Views 供氣泡大小使用
-                matrix_stats['Log_Views'] = np.log10(matrix_stats['Final_Views'] + 1)
-
-                # 繪圖
-                if not matrix_stats.empty:
-                    fig_bubble = px.scatter(
-                        matrix_stats,
-                        x='Weeks_Present_Overseas', 
-                        y='Export_Countries',       
-                        size='Log_Views',           
-                        color='Best_Rank_Overseas', 
-                        hover_name='show_title',
-                        hover_data={'Log_Views': False, 'Final_Views': True}, 
-                        
-                        range_color=[1, 10], 
-                        color_continuous_scale='Reds_r',
-                        
-                        # --- 視覺修正區 ---
-                        size_max=20,   # [修正] 縮小最大尺寸，避免遮擋
-                        opacity=0.7,   # [修正] 增加透明度，重疊時可透視
-                        # -----------------
-                        
-                        title=f"{target_country} 作品輸出強弱分佈",
-                        labels={
-                            'Weeks_Present_Overseas': '海外上榜週數 (不重複)',
-                            'Export_Countries': '輸出國家數',
-                            'Final_Views': '總觀看次數',
-                            'Best_Rank_Overseas': '最佳名次'
-                        }
-                    )
-                    fig_bubble.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey'))) # 細邊框
-                    fig_bubble.update_layout(margin=dict(l=20, r=20, t=50, b=20))
-                    
-                    st.plotly_chart(fig_bubble, use_container_width=True)
-
-                    st.markdown("##### 📌 矩陣數據詳表")
-                    display_table = matrix_stats.sort_values('Final_Views', ascending=False)
-                    display_table['Final_Views_Formatted'] = display_table['Final_Views'].apply(lambda x: "{:,.0f}".format(x))
-                    st.dataframe(display_table[['show_title', 'Weeks_Present_Overseas', 'Export_Countries', 'Best_Rank_Overseas', 'Final_Views_Formatted']], use_container_width=True)
-                else:
-                    st.warning("數據計算後為空。")
+                st.plotly_chart(figures['matrix'], use_container_width=True)
+
+                st.markdown("##### 📌 矩陣數據詳表")
+                st.dataframe(summary['matrix_table'], use_container_width=True)
 
         # --- 2. 最強傳播作品 ---
         with tab2:
             st.subheader("傳播力最強的作品")
-            traveling = filtered_df.groupby('show_title')['country_name'].nunique().reset_index(name='Country_Count').sort_values('Country_Count', ascending=False).head(10)
-            fig = px.bar(traveling, x='Country_Count', y='show_title', orientation='h', text_auto=True, title=f"輸出國家數最多的 Top 10 作品", color='Country_Count', color_continuous_scale='Oranges')
-            fig.update_layout(yaxis={'categoryorder':'total ascending'})
-            st.plotly_chart(fig, use_container_width=True)
+            traveling = summary['traveling']
+            st.plotly_chart(figures['traveling'], use_container_width=True)
             st.dataframe(traveling, use_container_width=True)
 
         # --- 3. 全球版圖 ---
         with tab3:
             st.subheader("全球輸出版圖")
-            coverage = filtered_df.groupby('country_name')['show_title'].nunique().reset_index(name='Unique_Titles')
-            st.plotly_chart(px.choropleth(coverage, locations="country_name", locationmode="country names", color="Unique_Titles", color_continuous_scale='Reds', title=f"{target_country} 作品覆蓋熱度圖"), use_container_width=True)
-            st.dataframe(coverage.sort_values('Unique_Titles', ascending=False), use_container_width=True)
+            coverage = summary['coverage']
+            st.plotly_chart(figures['coverage_map'], use_container_width=True)
+            st.dataframe(coverage, use_container_width=True)
 
         # --- 4. 海外市場表現 ---
         with tab4:
             st.subheader("海外市場表現 (排除本國)")
-            export_df = filtered_df[filtered_df['country_name'] != target_country]
-            if export_df.empty: st.info("僅在本國上榜。")
+            export_stats = summary['export_stats']
+            if export_stats.empty: st.info("僅在本國上榜。")
             else:
-                export_stats = export_df.groupby('country_name')['show_title'].nunique().reset_index(name='Exported_Titles').sort_values('Exported_Titles', ascending=False)
                 c1, c2 = st.columns([2, 1])
-                with c1: st.plotly_chart(px.choropleth(export_stats, locations="country_name", locationmode="country names", color="Exported_Titles", color_continuous_scale='Purples', title="海外輸出地圖"), use_container_width=True)
+                with c1: st.plotly_chart(figures['export_map'], use_container_width=True)
                 with c2: st.dataframe(export_stats, use_container_width=True)
 
         # --- 5. 總週數排名 ---
         with tab5:
             st.subheader("各市場總熱度 (總週數)")
-            raw_weeks = filtered_df['country_name'].value_counts().reset_index()
-            raw_weeks.columns = ['Country', 'Total_Weeks']
-            fig = px.bar(raw_weeks.head(20), x='Total_Weeks', y='Country', orientation='h', text_auto=True, title="上榜總週數 Top 20 市場")
-            fig.update_layout(yaxis={'categoryorder':'total ascending'})
-            st.plotly_chart(fig, use_container_width=True)
+            raw_weeks = summary['raw_weeks']
+            st.plotly_chart(figures['market_weeks'], use_container_width=True)
             st.dataframe(raw_weeks, use_container_width=True)
 
         # --- 6. 詳細輸出清單 ---
         with tab6:
             st.subheader("各市場上榜作品明細")
-            st.dataframe(filtered_df.groupby('country_name')['show_title'].unique().apply(lambda x: ", ".join(x)).reset_index(name='Titles_List'), use_container_width=True)
+            st.dataframe(summary['detail_list'], use_container_width=True)
 
         # --- 7. 原始數據 ---
         with tab7:
@@ -304,16 +531,21 @@ class NetflixAnalyzerV6:
         with st.expander("🤖 AI 輸出分析"):
             if self.api_key and st.button("生成製片國報告"):
                 prompt = f"分析 {target_country} ({category_mode}) 文化輸出，請給3點洞察。"
-                st.markdown(ask_gemini(self.api_key, prompt, self.model_name))
+                st.write_stream(ask_gemini(self.api_key, prompt, self.model_name))
 
 # ==========================================
 # 6. 主程式執行邏輯
 # ==========================================
-analyzer = NetflixAnalyzerV6(df_main, gemini_api_key, selected_model)
-analysis_mode = st.sidebar.radio("分析視角", ("觀看國 (Viewer)", "製片國 (Producer)"))
+# 分析面板包成 fragment：面板內的互動 (如 AI 報告按鈕) 只重跑此區塊，不會重跑整頁
+@st.fragment
+def run_analysis(analyzer, is_viewer, country):
+    if is_viewer:
+        analyzer.analyze_viewer(country)
+    else:
+        analyzer.analyze_producer(country)
 
-available_countries = sorted(list(set(df_main['country_name'].unique()) | set(df_main['Country'].unique())))
-final_country_list = sorted([c for c in available_countries if c in TARGET_COUNTRIES])
+analyzer = NetflixAnalyzerV6(viewer_countries, producer_countries, gemini_api_key, selected_model)
+analysis_mode = st.sidebar.radio("分析視角", ("觀看國 (Viewer)", "製片國 (Producer)"))
 
 if not final_country_list:
     st.warning("⚠️ 篩選後的資料中沒有包含您指定的目標國家。")
@@ -321,8 +553,8 @@ else:
     if "觀看國" in analysis_mode:
         selected_country = st.sidebar.selectbox("選擇觀看國家", final_country_list)
         if st.sidebar.button("開始分析"):
-            analyzer.analyze_viewer(selected_country)
+            run_analysis(analyzer, True, selected_country)
     else:
         selected_country = st.sidebar.selectbox("選擇製片國家", final_country_list)
         if st.sidebar.button("開始分析"):
-            analyzer.analyze_producer(selected_country)
+            run_analysis(analyzer, False, selected_country)